@@ -1,41 +1,67 @@
 import os
+import base64
+import posixpath
+import re
+import functools
+import hashlib
 import requests
-import subprocess
-from github import Github
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+from github import Auth, Github, InputGitTreeElement
 from typing import List, Dict, Optional, Tuple, Union
 from pathlib import Path
 import argparse
+import contextlib
 import sys
 import logging
+import logging.handlers
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import yaml
-import shutil
+try:
+    from yaml import CSafeLoader as YAMLLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as YAMLLoader
 import time
 import json
 from datetime import datetime
 from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
 
-# Configure logging with file output
-log_dir = Path("logs")
-log_dir.mkdir(exist_ok=True)
-log_file = log_dir / f"migration_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging() -> None:
+    """Log to stdout and to a size-bounded file under logs/"""
+    log_dir = Path("logs")
+    log_dir.mkdir(exist_ok=True)
+    log_file = log_dir / f"migration_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.handlers.RotatingFileHandler(log_file, maxBytes=10_000_000, backupCount=3),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
 # GitHub Token (Set this as an environment variable)
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-if not GITHUB_TOKEN:
-    raise ValueError("GITHUB_TOKEN environment variable is not set")
 
-HEADERS = {"Authorization": f"token {GITHUB_TOKEN}"}
+def require_token() -> str:
+    """Return the GitHub token, failing if it is not configured"""
+    if not GITHUB_TOKEN:
+        raise ValueError("GITHUB_TOKEN environment variable is not set")
+    return GITHUB_TOKEN
+
+HEADERS = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+GITHUB_API_URL = "https://api.github.com"
+GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+GRAPHQL_BATCH_SIZE = 100
+SEARCH_PAGE_SIZE = 100
+SEARCH_QUERY = "github/codeql-action in:file path:.github/workflows @v2"
+WORKFLOW_DIR = ".github/workflows"
 
 # Enhanced default settings
 DEFAULT_PER_PAGE = 10
@@ -59,8 +85,104 @@ For more information, see the [CodeQL Action documentation](https://github.com/g
 
 MAX_RETRIES = 5
 TIMEOUT = 45
-RETRY_DELAY = 5
 BATCH_SIZE = 5
+BLOB_FETCH_WORKERS = 10  # concurrent blob downloads per repository
+
+CACHE_DIR = Path.home() / ".cache" / "codeql-migrator"
+SEARCH_CACHE_TTL = 3600  # seconds
+ETAG_CACHE_FILE = CACHE_DIR / "etag.json"
+ETAG_CACHE_MAX_AGE = 7 * 24 * 3600  # seconds since an entry was last requested
+ETAG_CACHE_MAX_BYTES = 5_000_000
+TREE_CACHE_FILE = CACHE_DIR / "trees.json"
+TREE_CACHE_MAX_ENTRIES = 10_000
+
+# URL -> (ETag, body, next-page URL) of the last 200 response, and URL ->
+# time it was last requested
+_etag_cache: Dict[str, Tuple[str, bytes, Optional[str]]] = {}
+_etag_used: Dict[str, float] = {}
+
+# Tree URL -> {path: (mode, blob SHA)} of its workflow files, least recently
+# used first
+_tree_cache: Dict[str, Dict[str, Tuple[str, str]]] = {}
+
+# POSTs that create something GitHub will refuse to create twice; replaying
+# one after a 5xx or a dropped response would turn success into a 422
+_NON_IDEMPOTENT_POST_RE = re.compile(r"/(git/refs|pulls)/?$")
+
+class GitHubRetry(Retry):
+    """urllib3 Retry tuned for the GitHub API.
+
+    A 403 is only retried when GitHub marks it as a rate limit (Retry-After
+    present, or X-RateLimit-Remaining of 0, in which case the wait lasts
+    until X-RateLimit-Reset); any other 403, such as a missing permission,
+    is returned at once. Ref and pull request creation are never replayed
+    after a server error or a lost response. With raise_on_status=False the
+    final response is handed back instead of a bare RetryError, so callers
+    see GitHub's own error message.
+    """
+
+    @staticmethod
+    def _is_rate_limited(response) -> bool:
+        return (
+            response.status == 429
+            or "Retry-After" in response.headers
+            or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    @staticmethod
+    def _is_non_idempotent(method: Optional[str], url: Optional[str]) -> bool:
+        return method == "POST" and bool(url) and bool(_NON_IDEMPOTENT_POST_RE.search(urlsplit(url).path))
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None:
+            rate_limited = self._is_rate_limited(response)
+            if response.status == 403 and not rate_limited:
+                raise MaxRetryError(_pool, url, ResponseError("403 is not a rate limit"))
+            if not rate_limited and self._is_non_idempotent(method, url):
+                raise MaxRetryError(_pool, url, ResponseError(f"not replaying {method} {url}"))
+        elif error is not None and self._is_non_idempotent(method, url) and not self._is_connection_error(error):
+            # The request may have reached GitHub; only connect failures are safe to retry
+            raise error.with_traceback(_stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None and response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset and reset.isdigit():
+                return max(int(reset) - time.time(), 0) + 1
+        return retry_after
+
+# Shared keep-alive connection pool for every raw API call; main() resizes it
+# with size_http_pool() to fit the worker threads' blob fetches
+HTTP_RETRY = GitHubRetry(
+    total=MAX_RETRIES,
+    backoff_factor=1,
+    status_forcelist=(403, 429, 500, 502, 503, 504),
+    respect_retry_after_header=True,
+    allowed_methods=frozenset(["GET", "POST", "PUT", "PATCH"]),
+    raise_on_status=False
+)
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=HTTP_RETRY))
+
+def size_http_pool(max_workers: int) -> None:
+    """Size the shared pool so every in-flight request can keep its connection.
+
+    Each worker thread fans out up to BLOB_FETCH_WORKERS blob downloads at
+    once; a smaller pool makes urllib3 discard connections instead of
+    keeping them alive.
+    """
+    SESSION.adapters["https://"].close()
+    SESSION.mount("https://", HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=max(32, max_workers * BLOB_FETCH_WORKERS),
+        max_retries=HTTP_RETRY
+    ))
+
+# One PyGithub client shared by all worker threads
+GH = Github(auth=Auth.Token(GITHUB_TOKEN) if GITHUB_TOKEN else None, per_page=100, timeout=TIMEOUT, retry=HTTP_RETRY, pool_size=32)
 
 # Extended CodeQL action mappings
 CODEQL_UPDATES = {
@@ -71,12 +193,35 @@ CODEQL_UPDATES = {
     "uses: github/codeql-action@v2": "uses: github/codeql-action@v3"
 }
 
+# Workflow blobs are matched and rewritten as raw bytes, so files that need
+# no change are never decoded
+CODEQL_UPDATES_BYTES = {k.encode("utf-8"): v.encode("utf-8") for k, v in CODEQL_UPDATES.items()}
+
+# All mappings as one alternation so each file is scanned once; longest keys
+# first so no mapping can shadow a longer one
+_CODEQL_RE_BYTES = re.compile(
+    b"|".join(re.escape(k) for k in sorted(CODEQL_UPDATES_BYTES, key=len, reverse=True))
+)
+_REPL_BYTES = lambda match: CODEQL_UPDATES_BYTES[match.group(0)]
+# Every mapping contains this, so files without it can be skipped outright
+_CODEQL_MARKER = "codeql-action"
+_CODEQL_MARKER_BYTES = _CODEQL_MARKER.encode("utf-8")
+
 # Additional configuration options
 WORKFLOW_CONFIG = {
     "supported_languages": ["cpp", "csharp", "go", "java", "javascript", "python", "ruby"],
     "default_queries": "security-extended",
     "query_suites": ["security-extended", "security-and-quality"]
 }
+_SUPPORTED_LANGS = set(WORKFLOW_CONFIG["supported_languages"])
+
+# Regex versions of the checks in validate_workflow_file. The languages
+# value is captured whether it is a scalar, a flow list ([a, b]) or a block
+# list of "- a" lines, then searched for a supported language.
+_HAS_JOBS_RE = re.compile(r"^jobs\s*:", re.M)
+_CODEQL_STEP_RE = re.compile(r"uses:\s*[\"']?github/codeql-action[/@]\S+")
+_LANGUAGES_VALUE_RE = re.compile(r"\blanguages:([^\n]*(?:\n[ \t]*-[^\n]*)*)")
+_SUPPORTED_LANG_RE = re.compile(rf"\b({'|'.join(sorted(_SUPPORTED_LANGS))})\b")
 
 class MigratorError(Exception):
     """Base exception for migrator errors"""
@@ -94,10 +239,6 @@ class ValidationError(MigratorError):
     """Raised when validation fails"""
     pass
 
-class CleanupError(MigratorError):
-    """Raised when cleanup operations fail"""
-    pass
-
 def parse_arguments() -> argparse.Namespace:
     """Parse command line arguments with extended options."""
     parser = argparse.ArgumentParser(
@@ -121,12 +262,6 @@ def parse_arguments() -> argparse.Namespace:
         default=DEFAULT_BRANCH_NAME,
         help="Name of the branch to create for the changes"
     )
-    parser.add_argument(
-        "--skip-cleanup",
-        action="store_true",
-        default=False,
-        help="Skip cleanup of cloned repositories"
-    )
     parser.add_argument(
         "--max-workers",
         type=int,
@@ -145,6 +280,24 @@ def parse_arguments() -> argparse.Namespace:
         default=False,
         help="Force update without prompts"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="Ignore cached search results and ETags and query GitHub again"
+    )
+    parser.add_argument(
+        "--strict-validate",
+        action="store_true",
+        default=False,
+        help="Validate updated workflows by parsing the YAML instead of pattern matching"
+    )
+    parser.add_argument(
+        "--use-pygithub",
+        action="store_true",
+        default=False,
+        help="Create pull requests through PyGithub instead of raw REST calls"
+    )
     parser.add_argument(
         "--report",
         action="store_true",
@@ -154,40 +307,53 @@ def parse_arguments() -> argparse.Namespace:
     args = parser.parse_args()
     return args
 
-def retry_with_backoff(func):
-    """Enhanced decorator for retrying functions with exponential backoff and progress tracking"""
-    def wrapper(*args, **kwargs):
-        for attempt in range(MAX_RETRIES):
-            try:
-                return func(*args, **kwargs)
-            except (requests.exceptions.RequestException, GitHubAPIError) as e:
-                if attempt == MAX_RETRIES - 1:
-                    raise GitHubAPIError(f"Failed after {MAX_RETRIES} attempts: {str(e)}")
-                wait_time = RETRY_DELAY * (2 ** attempt)
-                logger.warning(f"Attempt {attempt + 1} failed, retrying in {wait_time}s... Error: {str(e)}")
-                time.sleep(wait_time)
-        return None
-    return wrapper
-
-def generate_migration_report(results: List[Dict]) -> None:
-    """Generate a detailed migration report"""
-    report = {
-        "timestamp": datetime.now().isoformat(),
-        "total_repositories": len(results),
-        "successful_migrations": sum(1 for r in results if r.get("success")),
-        "failed_migrations": sum(1 for r in results if not r.get("success")),
-        "details": results
-    }
-    
-    report_file = f"migration_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(report_file, 'w') as f:
-        json.dump(report, f, indent=2)
+def generate_migration_report(jsonl_path: Path) -> None:
+    """Generate a detailed migration report from the streamed per-repository results.
+
+    Results are read back one line at a time and written straight out, so
+    the full set of results is never held in memory.
+    """
+    report_file = jsonl_path.with_suffix(".json")
+    total = successful = 0
+    with open(jsonl_path, "r", encoding="utf-8") as src, open(report_file, "w", encoding="utf-8") as f:
+        f.write(f'{{\n  "timestamp": {json.dumps(datetime.now().isoformat())},\n  "details": [')
+        for line in src:
+            result = json.loads(line)
+            f.write(",\n    " if total else "\n    ")
+            f.write(json.dumps(result))
+            total += 1
+            successful += bool(result.get("success"))
+        f.write("\n  ],\n")
+        f.write(f'  "total_repositories": {total},\n')
+        f.write(f'  "successful_migrations": {successful},\n')
+        f.write(f'  "failed_migrations": {total - successful}\n}}\n')
     logger.info(f"Migration report generated: {report_file}")
 
-def validate_workflow_file(content: str) -> Tuple[bool, List[str]]:
-    """Enhanced workflow validation with detailed checks"""
+def validate_workflow_file(content: str, strict: bool = False) -> Tuple[bool, List[str]]:
+    """Enhanced workflow validation with detailed checks.
+
+    Both modes check that the workflow has jobs and, if it uses CodeQL, that
+    some CodeQL step's "languages" input names a supported language. By
+    default this runs as regexes over the raw text; strict=True parses the
+    YAML and reads the inputs of each CodeQL step.
+    """
+    # Only CodeQL invariants are checked, so don't pay for a parse without them
+    if _CODEQL_MARKER not in content:
+        return True, []
+
+    if not strict:
+        if not _HAS_JOBS_RE.search(content):
+            return False, ["No jobs defined in workflow"]
+        has_language = any(
+            _SUPPORTED_LANG_RE.search(match.group(1))
+            for match in _LANGUAGES_VALUE_RE.finditer(content)
+        )
+        if _CODEQL_STEP_RE.search(content) and not has_language:
+            return False, ["No supported languages specified in CodeQL configuration"]
+        return True, []
+
     try:
-        yaml_content = yaml.safe_load(content)
+        yaml_content = yaml.load(content, Loader=YAMLLoader)
         if not yaml_content:
             return False, ["Empty workflow file"]
         
@@ -195,29 +361,433 @@ def validate_workflow_file(content: str) -> Tuple[bool, List[str]]:
         if "jobs" not in yaml_content:
             issues.append("No jobs defined in workflow")
         
-        # Validate CodeQL-specific configurations
+        # Validate CodeQL-specific configurations. Only init takes languages,
+        # so one CodeQL step naming a supported language is enough
+        uses_codeql = has_language = False
         for job in yaml_content.get("jobs", {}).values():
             if "steps" in job:
                 for step in job["steps"]:
                     if isinstance(step, dict) and "uses" in step:
                         if "github/codeql-action" in step["uses"]:
-                            if not any(lang in str(step.get("with", {})) for lang in WORKFLOW_CONFIG["supported_languages"]):
-                                issues.append("No supported languages specified in CodeQL configuration")
-        
+                            uses_codeql = True
+                            inputs = step.get("with") or {}
+                            languages = str(inputs.get("languages", "")) if isinstance(inputs, dict) else ""
+                            if _SUPPORTED_LANG_RE.search(languages):
+                                has_language = True
+        if uses_codeql and not has_language:
+            issues.append("No supported languages specified in CodeQL configuration")
+
         return len(issues) == 0, issues
     except yaml.YAMLError as e:
         return False, [f"Invalid YAML content: {str(e)}"]
 
-def backup_workflow_file(filepath: Path) -> None:
-    """Create backup of workflow file before modification"""
-    backup_dir = filepath.parent / "backups"
-    backup_dir.mkdir(exist_ok=True)
-    backup_path = backup_dir / f"{filepath.name}.bak_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    shutil.copy2(filepath, backup_path)
-    logger.info(f"Created backup: {backup_path}")
+def prompt_user(question: str) -> bool:
+    """Ask a yes/no question on stdin"""
+    answer = input(f"{question} [y/N]: ").strip().lower()
+    return answer in ("y", "yes")
 
-def process_repository(repo: Dict, args: argparse.Namespace) -> Dict[str, Union[str, bool]]:
-    """Enhanced repository processing with detailed status tracking"""
+def _search_cache_path(query: str, total: int) -> Path:
+    """Location of the on-disk cache entry for a search"""
+    key = hashlib.sha256(f"{query}|{total}".encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"search-{key}.json"
+
+def _read_search_cache(cache_path: Path) -> Optional[Dict]:
+    """Load a cached search entry, or None if it is missing or unreadable"""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_search_cache(cache_path: Path, entry: Dict) -> None:
+    """Persist a search entry; failing to cache is never fatal"""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+    except OSError as e:
+        logger.warning(f"Could not write search cache {cache_path}: {str(e)}")
+
+def load_etag_cache() -> None:
+    """Load ETag-validated responses persisted by a previous run"""
+    try:
+        if ETAG_CACHE_FILE.stat().st_size > ETAG_CACHE_MAX_BYTES:
+            return
+        with open(ETAG_CACHE_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    for url, (etag, body, next_url, last_used) in entries.items():
+        _etag_cache[url] = (etag, base64.b64decode(body), next_url)
+        _etag_used[url] = last_used
+
+def save_etag_cache() -> None:
+    """Persist ETag-validated responses, most recently used first.
+
+    Entries unused for ETAG_CACHE_MAX_AGE are dropped, and older entries
+    are left out once the file would exceed ETAG_CACHE_MAX_BYTES.
+    """
+    cutoff = time.time() - ETAG_CACHE_MAX_AGE
+    entries = {}
+    size = 0
+    for url in sorted(_etag_cache, key=lambda u: _etag_used.get(u, 0), reverse=True):
+        if _etag_used.get(url, 0) < cutoff:
+            break
+        etag, body, next_url = _etag_cache[url]
+        entry = [etag, base64.b64encode(body).decode("ascii"), next_url, _etag_used[url]]
+        size += len(url) + len(json.dumps(entry))
+        if size > ETAG_CACHE_MAX_BYTES:
+            break
+        entries[url] = entry
+    try:
+        ETAG_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(ETAG_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+    except OSError as e:
+        logger.warning(f"Could not write ETag cache {ETAG_CACHE_FILE}: {str(e)}")
+
+def load_tree_cache() -> None:
+    """Load the workflow listings persisted by a previous run"""
+    try:
+        with open(TREE_CACHE_FILE, "r", encoding="utf-8") as f:
+            _tree_cache.update(json.load(f))
+    except (OSError, ValueError):
+        return
+
+def save_tree_cache() -> None:
+    """Persist the TREE_CACHE_MAX_ENTRIES most recently used workflow listings"""
+    entries = dict(list(_tree_cache.items())[-TREE_CACHE_MAX_ENTRIES:])
+    try:
+        TREE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(TREE_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+    except OSError as e:
+        logger.warning(f"Could not write tree cache {TREE_CACHE_FILE}: {str(e)}")
+
+def _cached_get(url: str) -> Tuple[requests.Response, bytes, Optional[str]]:
+    """GET a URL, revalidating an earlier response with If-None-Match.
+
+    Returns the response, its body and its Link rel="next" URL. On 304 the
+    body and next URL stored from the last 200 are replayed; 304 replies do
+    not count against the rate limit.
+    """
+    cached = _etag_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = SESSION.get(url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304 and cached:
+        _, body, next_url = cached
+    elif response.status_code == 200:
+        body = response.content
+        next_url = response.links.get("next", {}).get("url")
+        etag = response.headers.get("ETag")
+        if etag:
+            _etag_cache[url] = (etag, body, next_url)
+    else:
+        raise GitHubAPIError(f"GET {url} failed with status {response.status_code}: {response.text}")
+    _etag_used[url] = time.time()
+    return response, body, next_url
+
+def _wait_for_rate_limit(response: requests.Response) -> None:
+    """Sleep until the rate-limit window resets if it is nearly exhausted"""
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    if remaining is None or reset is None or int(remaining) >= 2:
+        return
+    delay = int(reset) - time.time()
+    if delay > 0:
+        logger.info(f"Rate limit nearly exhausted, sleeping {delay:.0f}s until reset")
+        time.sleep(delay)
+
+# A repeated search never touches the network; a failed one is not cached
+@functools.lru_cache(maxsize=32)
+def search_repositories(query: str, total: int, use_cache: bool = True) -> List[Dict]:
+    """Search GitHub for workflow files still referencing CodeQL Action v2.
+
+    Pages are walked by following the Link rel="next" header until total
+    repositories have been collected or there are no more pages.
+
+    Results are cached on disk for SEARCH_CACHE_TTL seconds; after that
+    each page is revalidated through _cached_get. use_cache=False ignores
+    any cached entry but still stores the fresh result.
+    """
+    cache_path = _search_cache_path(query, total)
+    cached = _read_search_cache(cache_path) if use_cache else None
+    if cached and time.time() - cache_path.stat().st_mtime < SEARCH_CACHE_TTL:
+        logger.info(f"Using cached search results from {cache_path}")
+        return cached["items"]
+
+    # Encode the query once; later page URLs come fully formed from GitHub
+    url = requests.Request(
+        "GET",
+        f"{GITHUB_API_URL}/search/code",
+        params={"q": query, "per_page": SEARCH_PAGE_SIZE}
+    ).prepare().url
+
+    repos = {}
+    while url and len(repos) < total:
+        response, body, url = _cached_get(url)
+
+        # Code search returns one item per matching file; keep one per repository
+        for item in json.loads(body).get("items", []):
+            repos.setdefault(item["repository"]["full_name"], item)
+
+        if url:
+            _wait_for_rate_limit(response)
+
+    items = list(repos.values())[:total]
+    _write_search_cache(cache_path, {"items": items})
+    return items
+
+def _fetch_blob(repo_owner: str, repo_name: str, sha: str) -> bytes:
+    """Download a single blob by SHA as raw bytes"""
+    url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/blobs/{sha}"
+    # The raw media type skips the base64-in-JSON envelope
+    response = SESSION.get(url, headers={"Accept": "application/vnd.github.raw"}, timeout=TIMEOUT)
+    if response.status_code != 200:
+        raise GitHubAPIError(f"Blob fetch failed with status {response.status_code}: {response.text}")
+    return response.content
+
+def fetch_repo_metadata(owner_names: List[Tuple[str, str]]) -> Dict[str, Tuple[str, str, str]]:
+    """Resolve default branch, head commit and tree for many repositories via GraphQL.
+
+    Repositories are looked up in aliased batches of GRAPHQL_BATCH_SIZE, so N
+    repositories cost ceil(N / 100) requests. Returns a mapping of
+    "owner/name" to (default branch, head commit SHA, root tree SHA);
+    repositories that are missing, inaccessible or empty are left out.
+    """
+    metadata = {}
+    for start in range(0, len(owner_names), GRAPHQL_BATCH_SIZE):
+        batch = owner_names[start:start + GRAPHQL_BATCH_SIZE]
+        fields = "\n".join(
+            f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) "
+            "{ defaultBranchRef { name target { ... on Commit { oid tree { oid } } } } }"
+            for i, (owner, name) in enumerate(batch)
+        )
+        response = SESSION.post(
+            GRAPHQL_URL,
+            json={"query": f"query {{\n{fields}\n}}"},
+            timeout=TIMEOUT
+        )
+        if response.status_code != 200:
+            raise GitHubAPIError(f"GraphQL query failed with status {response.status_code}: {response.text}")
+
+        payload = response.json()
+        errors = payload.get("errors")
+        if errors:
+            # Per-repository errors (e.g. NOT_FOUND) come with partial data
+            logger.warning(f"GraphQL metadata query reported errors: {json.dumps(errors)}")
+        data = payload.get("data")
+        if data is None:
+            raise GitHubAPIError(f"GraphQL metadata query failed: {json.dumps(errors)}")
+        for i, (owner, name) in enumerate(batch):
+            branch_ref = (data.get(f"r{i}") or {}).get("defaultBranchRef")
+            if branch_ref:
+                target = branch_ref["target"]
+                metadata[f"{owner}/{name}"] = (branch_ref["name"], target["oid"], target["tree"]["oid"])
+    return metadata
+
+def _get_tree(repo_owner: str, repo_name: str, sha: str, recursive: bool = False) -> Dict:
+    """Fetch one git tree (or the root tree of a commit) from the API"""
+    url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/trees/{sha}"
+    if recursive:
+        url += "?recursive=1"
+    response = SESSION.get(url, timeout=TIMEOUT)
+    if response.status_code != 200:
+        raise GitHubAPIError(f"Tree fetch failed with status {response.status_code}: {response.text}")
+    return response.json()
+
+def _list_workflow_dir(repo_owner: str, repo_name: str, ref: str) -> List[Dict]:
+    """List .github/workflows one directory level at a time.
+
+    Used when the recursive listing is truncated: three small non-recursive
+    tree fetches (root, .github, workflows) reach the directory however
+    large the rest of the repository is. Returned paths are repo-relative.
+    """
+    sha = ref
+    for name in WORKFLOW_DIR.split("/"):
+        entries = _get_tree(repo_owner, repo_name, sha)["tree"]
+        sha = next((e["sha"] for e in entries if e["path"] == name and e["type"] == "tree"), None)
+        if sha is None:
+            return []
+    return [
+        {**entry, "path": f"{WORKFLOW_DIR}/{entry['path']}"}
+        for entry in _get_tree(repo_owner, repo_name, sha)["tree"]
+    ]
+
+def fetch_workflow_files(repo_owner: str, repo_name: str, ref: str = "HEAD") -> Dict[str, Tuple[str, bytes]]:
+    """Fetch the workflow files of a repository without cloning it.
+
+    Returns a mapping of path to (file mode, raw content) for every YAML file
+    directly under .github/workflows/ at the given ref. If the repository
+    is too large for the API to list in full, the workflow directory is
+    listed on its own instead.
+    """
+    # A tree addressed by commit SHA can never change, so its listing is
+    # served from the cache without even an If-None-Match request. Only
+    # the filtered workflow entries are kept; full listings can run to
+    # megabytes
+    url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/trees/{ref}"
+    blobs = _tree_cache.pop(url, None) if ref != "HEAD" else None
+    if blobs is None:
+        tree = _get_tree(repo_owner, repo_name, ref, recursive=True)
+        entries = tree.get("tree", [])
+        if tree.get("truncated"):
+            logger.info(f"Tree listing for {repo_owner}/{repo_name} was truncated; listing {WORKFLOW_DIR} directly")
+            entries = _list_workflow_dir(repo_owner, repo_name, ref)
+
+        blobs = {
+            entry["path"]: (entry["mode"], entry["sha"])
+            for entry in entries
+            if entry["type"] == "blob"
+            and posixpath.dirname(entry["path"]) == WORKFLOW_DIR
+            and entry["path"].endswith((".yml", ".yaml"))
+        }
+    if ref != "HEAD":
+        # Re-inserting keeps the dict in least recently used order
+        _tree_cache[url] = blobs
+
+    with ThreadPoolExecutor(max_workers=BLOB_FETCH_WORKERS) as executor:
+        futures = {
+            path: executor.submit(_fetch_blob, repo_owner, repo_name, sha)
+            for path, (_, sha) in blobs.items()
+        }
+        return {path: (blobs[path][0], future.result()) for path, future in futures.items()}
+
+def find_and_update_workflows(
+    workflows: Dict[str, Tuple[str, bytes]],
+    strict_validate: bool = False
+) -> Dict[str, Tuple[str, str]]:
+    """Rewrite CodeQL v2 action references to v3 in the fetched workflow files.
+
+    Returns a mapping of path to (file mode, new content) for the files that
+    changed; only those files are decoded. The result is everything
+    create_pull_request needs, so nothing is listed or read twice.
+    """
+    updates = {}
+    for path, (mode, content) in workflows.items():
+        if _CODEQL_MARKER_BYTES not in content:
+            continue
+
+        new_bytes, replacements = _CODEQL_RE_BYTES.subn(_REPL_BYTES, content)
+        if replacements:
+            new_content = new_bytes.decode("utf-8")
+            is_valid, issues = validate_workflow_file(new_content, strict=strict_validate)
+            for issue in issues:
+                logger.warning(f"{path}: {issue}")
+            updates[path] = (mode, new_content)
+            logger.info(f"Updated {path}")
+
+    return updates
+
+def _api_post(path: str, payload: Dict) -> Dict:
+    """POST a JSON payload to the REST API through the shared session"""
+    response = SESSION.post(f"{GITHUB_API_URL}{path}", json=payload, timeout=TIMEOUT)
+    if response.status_code not in (200, 201):
+        raise GitHubAPIError(f"POST {path} failed with status {response.status_code}: {response.text}")
+    return response.json()
+
+def _push_and_open_pr_rest(
+    repo_owner: str,
+    repo_name: str,
+    branch_name: str,
+    updates: Dict[str, Tuple[str, str]],
+    base: Tuple[str, str, str]
+) -> str:
+    """Create tree, commit, branch and PR with four raw REST calls"""
+    default_branch, base_sha, base_tree_sha = base
+    prefix = f"/repos/{repo_owner}/{repo_name}"
+
+    tree = _api_post(f"{prefix}/git/trees", {
+        "base_tree": base_tree_sha,
+        "tree": [
+            {"path": path, "mode": mode, "type": "blob", "content": content}
+            for path, (mode, content) in updates.items()
+        ]
+    })
+    commit = _api_post(f"{prefix}/git/commits", {
+        "message": "Update CodeQL to v3",
+        "tree": tree["sha"],
+        "parents": [base_sha]
+    })
+    _api_post(f"{prefix}/git/refs", {"ref": f"refs/heads/{branch_name}", "sha": commit["sha"]})
+    pr = _api_post(f"{prefix}/pulls", {
+        "title": DEFAULT_PR_TITLE,
+        "body": DEFAULT_PR_BODY,
+        "head": branch_name,
+        "base": default_branch
+    })
+    return pr["html_url"]
+
+def _push_and_open_pr_pygithub(
+    repo_owner: str,
+    repo_name: str,
+    branch_name: str,
+    updates: Dict[str, Tuple[str, str]],
+    base: Tuple[str, str, str]
+) -> str:
+    """Create tree, commit, branch and PR through PyGithub"""
+    default_branch, base_sha, _ = base
+    # Branch and base commit come from fetch_repo_metadata, so the
+    # repository itself never needs to be fetched
+    repo = GH.get_repo(f"{repo_owner}/{repo_name}", lazy=True)
+    base_commit = repo.get_git_commit(base_sha)
+
+    # One tree and one commit for all files, then point the new branch at it
+    tree = repo.create_git_tree(
+        [
+            InputGitTreeElement(path, mode, "blob", content=content)
+            for path, (mode, content) in updates.items()
+        ],
+        base_tree=base_commit.tree
+    )
+    commit = repo.create_git_commit("Update CodeQL to v3", tree, [base_commit])
+    repo.create_git_ref(f"refs/heads/{branch_name}", commit.sha)
+
+    pr = repo.create_pull(
+        title=DEFAULT_PR_TITLE,
+        body=DEFAULT_PR_BODY,
+        head=branch_name,
+        base=default_branch
+    )
+    return pr.html_url
+
+def create_pull_request(
+    repo_owner: str,
+    repo_name: str,
+    branch_name: str,
+    updates: Dict[str, Tuple[str, str]],
+    base: Tuple[str, str, str],
+    dry_run: bool,
+    use_pygithub: bool = False
+) -> Optional[str]:
+    """Push the updated workflow files to a new branch and open a pull request.
+
+    base is the (default branch, head commit SHA, root tree SHA) triple from
+    fetch_repo_metadata, and updates maps each path to its (file mode, new
+    content) so executable bits survive. Raw REST calls are used unless
+    use_pygithub is set.
+    """
+    if dry_run:
+        logger.info(f"Would create PR for {repo_owner}/{repo_name}")
+        return None
+
+    push_and_open_pr = _push_and_open_pr_pygithub if use_pygithub else _push_and_open_pr_rest
+    try:
+        return push_and_open_pr(repo_owner, repo_name, branch_name, updates, base)
+    except Exception as e:
+        raise GitHubAPIError(f"Failed to create PR for {repo_owner}/{repo_name}: {str(e)}")
+
+def process_repository(
+    repo: Dict,
+    args: argparse.Namespace,
+    base: Optional[Tuple[str, str, str]] = None,
+    approved: Optional[Dict[str, bool]] = None
+) -> Dict[str, Union[str, bool]]:
+    """Enhanced repository processing with detailed status tracking.
+
+    approved maps "owner/name" to the answer given in main(); workers never
+    prompt themselves. None approves every repository.
+    """
     result = {
         "repository": f"{repo['repository']['owner']['login']}/{repo['repository']['name']}",
         "success": False,
@@ -226,39 +796,52 @@ def process_repository(repo: Dict, args: argparse.Namespace) -> Dict[str, Union[
         "pr_url": None
     }
 
-    repo_url = repo["repository"]["clone_url"]
     repo_name = repo["repository"]["name"]
     repo_owner = repo["repository"]["owner"]["login"]
 
     logger.info(f"Processing {repo_owner}/{repo_name}...")
     
     if args.dry_run:
-        logger.info(f"Would clone and update {repo_name}")
+        logger.info(f"Would fetch and update workflows in {repo_name}")
         result["success"] = True
         result["actions_taken"].append("dry_run")
         return result
 
+    if approved is not None and not approved.get(result["repository"]):
+        result["actions_taken"].append("pr_declined")
+        logger.info(f"Skipping {repo_owner}/{repo_name} as requested")
+        return result
+
+    if base is None:
+        result["errors"].append("Repository metadata unavailable")
+        logger.error(f"Could not resolve default branch for {repo_owner}/{repo_name}")
+        return result
+
+    _, base_sha, _ = base
     try:
-        clone_repo(repo_url, repo_name)
-        result["actions_taken"].append("cloned")
+        workflows = fetch_workflow_files(repo_owner, repo_name, base_sha)
+        result["actions_taken"].append("workflows_fetched")
 
-        if find_and_update_workflows(repo_name):
+        updates = find_and_update_workflows(workflows, args.strict_validate)
+        if updates:
             result["actions_taken"].append("workflows_updated")
-            
-            if args.force or prompt_user(f"Create PR for {repo_name}?"):
-                pr_url = create_pull_request(
-                    repo_owner,
-                    repo_name,
-                    args.branch_name,
-                    args.dry_run
-                )
-                if pr_url:
-                    result["pr_url"] = pr_url
-                    result["success"] = True
-                    result["actions_taken"].append("pr_created")
-                    logger.info(f"PR Created: {pr_url}")
-                else:
-                    result["errors"].append("Failed to create PR")
+
+            pr_url = create_pull_request(
+                repo_owner,
+                repo_name,
+                args.branch_name,
+                updates,
+                base,
+                args.dry_run,
+                use_pygithub=args.use_pygithub
+            )
+            if pr_url:
+                result["pr_url"] = pr_url
+                result["success"] = True
+                result["actions_taken"].append("pr_created")
+                logger.info(f"PR Created: {pr_url}")
+            else:
+                result["errors"].append("Failed to create PR")
         else:
             result["actions_taken"].append("no_updates_needed")
             logger.info(f"No updates needed for {repo_name}")
@@ -267,25 +850,23 @@ def process_repository(repo: Dict, args: argparse.Namespace) -> Dict[str, Union[
         error_msg = f"Error processing {repo_name}: {str(e)}"
         result["errors"].append(error_msg)
         logger.error(error_msg)
-    finally:
-        if not args.skip_cleanup:
-            try:
-                cleanup_resources(Path(repo_name))
-                result["actions_taken"].append("cleanup_completed")
-            except CleanupError as e:
-                result["errors"].append(f"Cleanup error: {str(e)}")
-                logger.error(str(e))
-    
+
     return result
 
 def main() -> None:
     """Enhanced main function with progress tracking and reporting"""
     try:
         args = parse_arguments()
+        configure_logging()
+        require_token()
+        size_http_pool(args.max_workers)
         start_time = time.time()
         
         logger.info("Starting CodeQL migration process...")
-        repos = search_repositories(args.per_page)
+        if not args.no_cache:
+            load_etag_cache()
+            load_tree_cache()
+        repos = search_repositories(SEARCH_QUERY, args.per_page, use_cache=not args.no_cache)
         
         if not repos:
             logger.info("No repositories found using CodeQL v2.")
@@ -296,27 +877,70 @@ def main() -> None:
             logger.info("Operation cancelled.")
             return
 
-        results = []
-        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-            futures = []
+        # Ask about every repository up front on the main thread so the
+        # workers never block on stdin
+        approved = None
+        if not args.force and not args.dry_run:
+            approved = {
+                repo["repository"]["full_name"]: prompt_user(f"Create PR for {repo['repository']['full_name']}?")
+                for repo in repos
+            }
+
+        metadata = {}
+        if not args.dry_run:
+            metadata = fetch_repo_metadata([
+                (repo["repository"]["owner"]["login"], repo["repository"]["name"])
+                for repo in repos
+                if approved is None or approved[repo["repository"]["full_name"]]
+            ])
+
+        # Results are appended to a line-buffered JSONL file as they arrive, so
+        # the report can be tailed during long runs
+        report_path = None
+        report_stream = contextlib.nullcontext()
+        if args.report:
+            report_path = Path(f"migration_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+            report_stream = open(report_path, "w", encoding="utf-8", buffering=1)
+
+        successful = failed = 0
+        worker = functools.partial(process_repository, args=args, approved=approved)
+        # Route console logging through tqdm.write so worker log lines don't
+        # tear the progress bar
+        with report_stream, ThreadPoolExecutor(max_workers=args.max_workers) as executor, logging_redirect_tqdm():
+            futures = set()
             for repo in repos:
-                future = executor.submit(process_repository, repo, args)
-                futures.append(future)
-            
+                base = metadata.get(repo["repository"]["full_name"])
+                futures.add(executor.submit(worker, repo, base=base))
+
             for future in tqdm(as_completed(futures), total=len(futures), desc="Processing repositories"):
+                # Drop our reference once consumed (as_completed drops its own),
+                # so each result dict is freed after it is written out
+                futures.discard(future)
                 try:
                     result = future.result()
-                    results.append(result)
                 except Exception as e:
                     logger.error(f"Error in worker thread: {str(e)}")
+                    continue
 
-        if args.report:
-            generate_migration_report(results)
+                if result["success"]:
+                    successful += 1
+                else:
+                    failed += 1
+                # Only this consumer loop writes, so no lock is needed
+                if report_path:
+                    report_stream.write(json.dumps(result) + "\n")
+
+        if not args.no_cache:
+            save_etag_cache()
+            save_tree_cache()
+
+        if report_path:
+            generate_migration_report(report_path)
 
         execution_time = time.time() - start_time
         logger.info(f"\nMigration completed in {execution_time:.2f} seconds!")
-        logger.info(f"Successful migrations: {sum(1 for r in results if r['success'])}")
-        logger.info(f"Failed migrations: {sum(1 for r in results if not r['success'])}")
+        logger.info(f"Successful migrations: {successful}")
+        logger.info(f"Failed migrations: {failed}")
         
     except KeyboardInterrupt:
         logger.error("\nOperation interrupted by user")